@@ -3,20 +3,57 @@ YouTube Video Downloader - Flask Backend
 Downloads YouTube videos in highest quality with audio using yt-dlp
 """
 
-from flask import Flask, render_template, request, jsonify, send_file, make_response
+from flask import Flask, Response, render_template, request, jsonify, send_file
+from flask_compress import Compress
 from flask_cors import CORS
 from flask_basicauth import BasicAuth
+from flask.json.provider import DefaultJSONProvider
+from collections import OrderedDict
+from functools import lru_cache
+import orjson
 import yt_dlp
 import os
+import queue
+import random
 import re
+import shutil
+import subprocess
+import tempfile
 import threading
 import uuid
 import time
 from pathlib import Path
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (C-implemented, much faster than json)"""
+
+    def dumps(self, obj, **kwargs):
+        # Accept non-str dict keys like the stdlib encoder does
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        # Fall back to Flask's handling of dates, UUIDs, dataclasses, etc.
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
+# Gzip JSON responses only: media files are already compressed and the progress
+# stream must not be buffered by the compressor
+app.config['COMPRESS_MIMETYPES'] = ['application/json']
+app.config['COMPRESS_ALGORITHM'] = 'gzip'
+app.config['COMPRESS_LEVEL'] = 4
+Compress(app)
+
+# Hand file transfers to a front proxy that honours X-Sendfile (Apache, lighttpd)
+app.use_x_sendfile = os.environ.get('USE_X_SENDFILE', '0') == '1'
+
 # Basic Auth Configuration
 class PasswordAuth(BasicAuth):
     def check_credentials(self, username, password):
@@ -26,44 +63,420 @@ class PasswordAuth(BasicAuth):
 app.config['BASIC_AUTH_FORCE'] = True  # Protect the entire site
 basic_auth = PasswordAuth(app)
 
+# Download states after which the worker no longer touches the entry
+FINISHED_STATUSES = ('completed', 'error')
+
+
+class DownloadRegistry:
+    """Thread-safe store for download progress and status
+
+    Download threads write to entries while request handlers read them, so every
+    access goes through one lock and readers only ever see copies. Fields whose
+    name starts with an underscore are internal bookkeeping and are left out of
+    snapshots. Subscribers receive a fresh snapshot on their queue after every
+    change. Entries are kept in creation order so prune() can evict the oldest.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._subscribers = {}
+
+    @staticmethod
+    def _public(entry):
+        return {k: v for k, v in entry.items() if not k.startswith('_')}
+
+    def _publish(self, download_id, entry):
+        # Caller must hold self._lock
+        subscribers = self._subscribers.get(download_id)
+        if subscribers:
+            state = self._public(entry)
+            for q in subscribers:
+                q.put(state)
+
+    def create(self, download_id, **fields):
+        """Register a new download, replacing any existing entry with the same ID"""
+        with self._lock:
+            entry = self._entries[download_id] = dict(fields, _created=time.time())
+            self._entries.move_to_end(download_id)
+            self._publish(download_id, entry)
+
+    def get(self, download_id, key, default=None):
+        """Return a single field of a download, or default if it is unknown"""
+        with self._lock:
+            entry = self._entries.get(download_id)
+            return entry.get(key, default) if entry is not None else default
+
+    def update(self, download_id, **fields):
+        """Set fields on an existing download; ignored if the download is unknown"""
+        with self._lock:
+            entry = self._entries.get(download_id)
+            if entry is not None:
+                entry.update(fields)
+                self._publish(download_id, entry)
+
+    def snapshot(self, download_id):
+        """Return a shallow copy of a download's public state, or None if it is unknown"""
+        with self._lock:
+            entry = self._entries.get(download_id)
+            if entry is None:
+                return None
+            return self._public(entry)
+
+    def prune(self, max_entries, max_age):
+        """Evict finished downloads beyond the newest max_entries or older than max_age seconds
+
+        Downloads still in progress are never evicted. Returns the files of evicted
+        downloads that no remaining download refers to.
+        """
+        cutoff = time.time() - max_age
+        with self._lock:
+            excess = len(self._entries) - max_entries
+            evicted_files = set()
+            for download_id, entry in list(self._entries.items()):
+                if excess <= 0 and entry['_created'] >= cutoff:
+                    break  # Everything after this is newer
+                if entry.get('status') not in FINISHED_STATUSES:
+                    continue
+                del self._entries[download_id]
+                self._subscribers.pop(download_id, None)
+                excess -= 1
+                if entry.get('filename'):
+                    evicted_files.add(entry['filename'])
+            in_use = {entry.get('filename') for entry in self._entries.values()}
+        return sorted(evicted_files - in_use)
+
+    def filenames(self):
+        """Return the set of files referred to by any registered download"""
+        with self._lock:
+            return {entry['filename'] for entry in self._entries.values() if entry.get('filename')}
+
+    def subscribe(self, download_id):
+        """Return a (queue, snapshot) pair; the queue receives a snapshot after each change
+
+        Returns (None, None) if the download is unknown.
+        """
+        with self._lock:
+            entry = self._entries.get(download_id)
+            if entry is None:
+                return None, None
+            q = queue.Queue()
+            self._subscribers.setdefault(download_id, []).append(q)
+            return q, self._public(entry)
+
+    def unsubscribe(self, download_id, q):
+        """Stop delivering updates to a queue returned by subscribe()"""
+        with self._lock:
+            subscribers = self._subscribers.get(download_id, [])
+            if q in subscribers:
+                subscribers.remove(q)
+            if not subscribers:
+                self._subscribers.pop(download_id, None)
+
+
+class WorkerPool:
+    """Fixed number of daemon threads running submitted jobs in FIFO order
+
+    Used instead of ThreadPoolExecutor, whose worker threads are non-daemon and are
+    joined at interpreter exit after draining the queue: Ctrl+C or SIGTERM would
+    then wait for every queued download. Daemon workers are simply abandoned
+    when the process exits, like the per-download threads they replace.
+    """
+
+    def __init__(self, max_workers, name):
+        self._jobs = queue.Queue()
+        for i in range(max_workers):
+            threading.Thread(target=self._work, name=f'{name}-{i}', daemon=True).start()
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) to run on the next free worker"""
+        self._jobs.put((fn, args))
+
+    def _work(self):
+        while True:
+            fn, args = self._jobs.get()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Background job {fn.__name__} failed: {e}")
+
+
 # Store download progress and status
-downloads = {}
+downloads = DownloadRegistry()
+
+# Registry bounds: finished downloads beyond MAX_DOWNLOADS or older than
+# DOWNLOAD_MAX_AGE seconds are forgotten and their files deleted. The periodic
+# sweep also deletes any other file in DOWNLOAD_DIR untouched for DOWNLOAD_MAX_AGE
+# (earlier runs, .part leftovers, failed MP3 conversions).
+MAX_DOWNLOADS = 1000
+DOWNLOAD_MAX_AGE = 24 * 60 * 60
+CLEANUP_INTERVAL = 60 * 60
+
+# Downloads running at once; further requests wait in the pool's queue
+DOWNLOAD_POOL = WorkerPool(int(os.environ.get('DL_CONCURRENCY', '4')), 'download')
+
+# MP3 re-encodes are CPU-bound, so they get their own pool sized to the CPU count
+POSTPROCESS_POOL = WorkerPool(os.cpu_count() or 1, 'postprocess')
+
+# Minimum seconds between progress writes; yt-dlp calls the hook for every chunk
+PROGRESS_INTERVAL = 0.1
+
+# Seconds between keep-alive comments on idle progress streams, so proxies don't time out
+SSE_HEARTBEAT = 15
+
+# Minimum seconds between streamed progress messages while the status is unchanged.
+# The hook writes at up to 10 Hz; streams send only the newest state each interval,
+# which is less than the page's 2 Hz polling. Status changes are sent immediately.
+SSE_MIN_INTERVAL = 1.0
+
+# Each open progress stream holds a server thread until its download finishes. Past
+# this many, /api/progress/stream answers 503 and the page polls instead, leaving
+# threads free for other requests. Keep it below gunicorn's --threads.
+PROGRESS_STREAM_LIMIT = int(os.environ.get('PROGRESS_STREAM_LIMIT', '4'))
+_progress_stream_slots = threading.BoundedSemaphore(PROGRESS_STREAM_LIMIT)
+
+# Cache of extract_info results by URL: {url: (timestamp, info)}
+INFO_CACHE_TTL = 300
+_info_cache = {}
+_info_cache_lock = threading.Lock()
+
+# Idle YoutubeDL instances for info extraction, all created with INFO_OPTS. Reusing
+# an instance keeps its HTTP connections (and cookies) alive, saving TCP/TLS
+# handshakes on the next request. LIFO so the most recently used instance, with the
+# warmest connections, goes first.
+_info_ydl_pool = queue.LifoQueue()
 
 # Download directory
 DOWNLOAD_DIR = Path(__file__).parent / "downloads"
 DOWNLOAD_DIR.mkdir(exist_ok=True)
 
 
+# Windows invalid filename characters, removed via str.translate
+_INVALID_FILENAME_CHARS = str.maketrans('', '', '<>:"/\\|?*')
+# Emojis and everything else outside the Basic Multilingual Plane
+_ASTRAL_CHARS = re.compile(r'[\U00010000-\U0010ffff]')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def resolve_cookie_file():
+    """Find the cookies file (Render Secret File or local), or None if there is none"""
+    # Render mounts secret files at /etc/secrets/ (Read-only)
+    # yt-dlp tries to write to the cookie file, so we must copy it to a writable location
+    cookie_locations = [
+        '/etc/secrets/cookies.txt',  # Render production path
+        'cookies.txt'                # Local development path
+    ]
+    
+    cookie_path = next((p for p in cookie_locations if os.path.exists(p)), None)
+    if cookie_path is None:
+        return None
+    
+    # If we are on Render (read-only mount), copy to /tmp
+    if cookie_path.startswith('/etc/secrets'):
+        try:
+            writable_cookie_path = os.path.join(tempfile.gettempdir(), 'cookies.txt')
+            shutil.copy2(cookie_path, writable_cookie_path)
+            print(f"Copied cookies to writable path: {writable_cookie_path}")
+            cookie_path = writable_cookie_path
+        except Exception as e:
+            print(f"Failed to copy cookies: {e}")
+            # Fallback to original path (might fail if write is strictly required)
+    print(f"Using cookies from: {cookie_path}")
+    return cookie_path
+
+
+# Resolved once at startup rather than on every request
+COOKIE_FILE = resolve_cookie_file()
+
+# yt-dlp options for the pooled info-extraction instances
+INFO_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    # FORCE IPv4: Render uses IPv6 by default which YouTube blocks extensively
+    'source_address': '0.0.0.0',
+}
+if COOKIE_FILE:
+    INFO_OPTS['cookiefile'] = COOKIE_FILE
+
+
 def sanitize_filename(filename):
     """Remove invalid characters and emojis from filename"""
     # Remove Windows invalid characters
-    filename = re.sub(r'[<>:"/\\|?*]', '', filename)
-    # Remove emojis and other non-ASCII characters that cause issues
-    filename = ''.join(c for c in filename if ord(c) < 65536 and (ord(c) < 0x1F600 or ord(c) > 0x1FAFF))
-    # Remove any remaining problematic Unicode characters (emojis in various ranges)
-    filename = re.sub(r'[\U00010000-\U0010ffff]', '', filename)
+    filename = filename.translate(_INVALID_FILENAME_CHARS)
+    # Remove emojis and other non-BMP characters that cause issues
+    filename = _ASTRAL_CHARS.sub('', filename)
     # Clean up extra spaces
-    filename = re.sub(r'\s+', ' ', filename).strip()
+    filename = _WHITESPACE.sub(' ', filename).strip()
     return filename
 
 
+def cleanup_downloads():
+    """Evict old downloads from the registry and delete their files"""
+    for path in downloads.prune(MAX_DOWNLOADS, DOWNLOAD_MAX_AGE):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Failed to delete {path}: {e}")
+
+
+def sweep_download_dir():
+    """Delete files in DOWNLOAD_DIR not modified for DOWNLOAD_MAX_AGE, unless a download uses them"""
+    cutoff = time.time() - DOWNLOAD_MAX_AGE
+    in_use = downloads.filenames()
+    with os.scandir(DOWNLOAD_DIR) as entries:
+        for entry in entries:
+            if entry.path in in_use:
+                continue
+            # Files can vanish mid-sweep (a .part renamed by yt-dlp, a source removed
+            # by convert_to_mp3), so every per-file step may fail
+            try:
+                if not entry.is_file() or entry.stat().st_mtime >= cutoff:
+                    continue
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                print(f"Failed to delete {entry.path}: {e}")
+
+
+def schedule_cleanup():
+    """Run cleanup_downloads and sweep_download_dir every CLEANUP_INTERVAL seconds in the background"""
+    def run():
+        try:
+            cleanup_downloads()
+            sweep_download_dir()
+        except Exception as e:
+            print(f"Download cleanup failed: {e}")
+        finally:
+            # Always re-arm, or one failure would stop the sweep for good
+            schedule_cleanup()
+    
+    timer = threading.Timer(CLEANUP_INTERVAL, run)
+    timer.daemon = True
+    timer.start()
+
+
+@lru_cache(maxsize=None)
+def quality_label(height):
+    """Human-readable label for a video height
+    
+    Memoized rather than a fixed lookup table: besides the standard heights, videos
+    can report arbitrary ones (e.g. 1600p), and each distinct height is labelled once.
+    """
+    if height >= 4320:
+        return f"8K ({height}p)"
+    if height >= 2160:
+        return f"4K ({height}p)"
+    if height >= 1440:
+        return f"2K ({height}p)"
+    return f"{height}p"
+
+
+def get_cached_info(url):
+    """Return info cached for url within INFO_CACHE_TTL, or None"""
+    with _info_cache_lock:
+        cached = _info_cache.get(url)
+        if cached and time.time() - cached[0] < INFO_CACHE_TTL:
+            return cached[1]
+    return None
+
+
+def get_info(url):
+    """Extract video info without downloading, reusing results cached within INFO_CACHE_TTL
+    
+    Extraction runs on a pooled YoutubeDL instance configured with INFO_OPTS.
+    
+    Args:
+        url: YouTube video URL
+    """
+    info = get_cached_info(url)
+    if info is not None:
+        return info
+    
+    try:
+        ydl = _info_ydl_pool.get_nowait()
+    except queue.Empty:
+        # yt-dlp fills in defaults on the params dict it's given, so each instance gets a copy
+        ydl = yt_dlp.YoutubeDL(dict(INFO_OPTS))
+    try:
+        info = ydl.extract_info(url, download=False)
+    finally:
+        # Pooled instances are never closed, so write the cookie jar back to
+        # COOKIE_FILE here as closing the instance would
+        try:
+            ydl.save_cookies()
+        except Exception as e:
+            print(f"Failed to save cookies: {e}")
+        _info_ydl_pool.put(ydl)
+    
+    now = time.time()
+    with _info_cache_lock:
+        _info_cache[url] = (now, info)
+        # Drop expired entries so the cache doesn't grow forever
+        for key in [k for k, (ts, _) in _info_cache.items() if now - ts >= INFO_CACHE_TTL]:
+            del _info_cache[key]
+    return info
+
+
 def progress_hook(d, download_id):
     """Track download progress"""
     if d['status'] == 'downloading':
+        now = time.monotonic()
+        if now - downloads.get(download_id, '_last_update', 0) < PROGRESS_INTERVAL:
+            return
+        fields = {'status': 'downloading', '_last_update': now}
         total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
         downloaded = d.get('downloaded_bytes', 0)
         if total > 0:
             percent = (downloaded / total) * 100
-            downloads[download_id]['progress'] = round(percent, 1)
-            downloads[download_id]['speed'] = d.get('speed', 0)
-            downloads[download_id]['eta'] = d.get('eta', 0)
+            fields.update(progress=round(percent, 1), speed=d.get('speed', 0), eta=d.get('eta', 0))
+        downloads.update(download_id, **fields)
     elif d['status'] == 'finished':
-        downloads[download_id]['progress'] = 100
-        downloads[download_id]['status'] = 'processing'
+        downloads.update(download_id, progress=100, status='processing')
+
+
+def update_metadata(download_id, info):
+    """Copy title, thumbnail and duration from a yt-dlp info dict to a download"""
+    downloads.update(
+        download_id,
+        title=sanitize_filename(info.get('title', 'video')),
+        thumbnail=info.get('thumbnail', ''),
+        duration=info.get('duration', 0),
+    )
+
+
+def convert_to_mp3(download_id, source):
+    """Re-encode a downloaded audio file to 320 kbps MP3 on a POSTPROCESS_POOL thread
+    
+    Args:
+        download_id: Unique ID for tracking this download
+        source: Path of the raw audio file; deleted once the MP3 is written
+    """
+    base, ext = os.path.splitext(source)
+    if ext.lower() == '.mp3':
+        # Already MP3; re-encoding onto the same path would clobber the input
+        downloads.update(download_id, status='completed', progress=100)
+        return
+    
+    # For audio, the extension changes to mp3
+    target = base + '.mp3'
+    try:
+        subprocess.run(
+            ['ffmpeg', '-y', '-loglevel', 'error', '-i', source, '-vn', '-b:a', '320k', target],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        os.remove(source)
+        downloads.update(download_id, filename=target, status='completed', progress=100)
+    except subprocess.CalledProcessError as e:
+        downloads.update(download_id, status='error', error=e.stderr.strip() or str(e))
+    except Exception as e:
+        downloads.update(download_id, status='error', error=str(e))
 
 
 def download_video(url, download_id, quality_height=0):
-    """Download video in a separate thread
+    """Download video on a DOWNLOAD_POOL worker thread
     
     Args:
         url: YouTube video URL
@@ -71,32 +484,18 @@ def download_video(url, download_id, quality_height=0):
         quality_height: Video height (e.g., 1080, 720, 480). 0 means audio only.
     """
     try:
-        downloads[download_id] = {
-            'status': 'starting',
-            'progress': 0,
-            'title': '',
-            'filename': '',
-            'error': None,
-            'speed': 0,
-            'eta': 0
-        }
+        downloads.update(download_id, status='starting')
         
         # Build format string based on quality
         if quality_height == 0:
-            # Audio only - extract as MP3
+            # Audio only - download the raw stream, convert_to_mp3 re-encodes it afterwards
             format_str = 'bestaudio/best'
             output_template = str(DOWNLOAD_DIR / '%(title)s.%(ext)s')
-            postprocessors = [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '320',
-            }]
         else:
             # Video - just get the best available, with extensive fallbacks
             # If 'best' fails, try '18' (legacy 360p mp4) which usually exists everywhere
             format_str = 'best/bestvideo+bestaudio/18'
             output_template = str(DOWNLOAD_DIR / '%(title)s.%(ext)s')
-            postprocessors = []
         
         # Configure yt-dlp options
         ydl_opts = {
@@ -106,54 +505,37 @@ def download_video(url, download_id, quality_height=0):
             'quiet': True,
             'no_warnings': True,
             'retries': 10,
+            'fragment_retries': 30,
+            # Back off between retries (seconds, by attempt number); failed fragments
+            # usually recover after a short pause, immediate retries just burn the budget
+            'retry_sleep_functions': {
+                'fragment': lambda n: min(2 ** n + random.random(), 30),
+                'http': lambda n: min(2 ** n, 30),
+                'file_access': lambda n: 2 ** n,
+            },
+            # Fetch HLS/DASH fragments in parallel; per-connection throughput is often throttled
+            'concurrent_fragment_downloads': int(os.environ.get('YTDLP_CONCURRENT_FRAGMENTS', '5')),
+            # 64 KiB buffer and 10 MiB HTTP ranges: fewer, larger writes to disk
+            'buffersize': 65536,
+            'http_chunk_size': 10485760,
+            # Keep mtime at download time (not the upload date) so sweep_download_dir
+            # measures age from when the file was written
+            'updatetime': False,
             # FORCE IPv4: Render uses IPv6 by default which YouTube blocks extensively
             'source_address': '0.0.0.0',
         }
 
-        # Check for cookies file (Render Secret File or local)
-        # Render mounts secret files at /etc/secrets/ (Read-only)
-        # yt-dlp tries to write to the cookie file, so we must copy it to a writable location
-        import shutil
-        import tempfile
-        
-        cookie_locations = [
-            '/etc/secrets/cookies.txt',  # Render production path
-            'cookies.txt'                # Local development path
-        ]
-        
-        for cookie_path in cookie_locations:
-            if os.path.exists(cookie_path):
-                # If we are on Render (read-only mount), copy to /tmp
-                if cookie_path.startswith('/etc/secrets'):
-                    try:
-                        temp_dir = tempfile.gettempdir()
-                        writable_cookie_path = os.path.join(temp_dir, 'cookies.txt')
-                        shutil.copy2(cookie_path, writable_cookie_path)
-                        ydl_opts['cookiefile'] = writable_cookie_path
-                        print(f"Copied cookies to: {writable_cookie_path}")
-                    except Exception as e:
-                        print(f"Failed to copy cookies: {e}")
-                        ydl_opts['cookiefile'] = cookie_path
-                else:
-                    ydl_opts['cookiefile'] = cookie_path
-                print(f"Using cookies from: {ydl_opts.get('cookiefile')}")
-                break
-        
-        if postprocessors:
-            ydl_opts['postprocessors'] = postprocessors
+        if COOKIE_FILE:
+            ydl_opts['cookiefile'] = COOKIE_FILE
         
         # Remove None values
         ydl_opts = {k: v for k, v in ydl_opts.items() if v is not None}
         
-        # First, get video info (use same opts with cookies!)
-        info_opts = {k: v for k, v in ydl_opts.items() if k != 'progress_hooks'}
-        with yt_dlp.YoutubeDL(info_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            title = sanitize_filename(info.get('title', 'video'))
-            downloads[download_id]['title'] = title
-            downloads[download_id]['thumbnail'] = info.get('thumbnail', '')
-            downloads[download_id]['duration'] = info.get('duration', 0)
-            downloads[download_id]['status'] = 'downloading'
+        # Show metadata right away if /api/info already fetched it; otherwise it
+        # comes from the download call itself, which extracts the same info
+        info = get_cached_info(url)
+        if info is not None:
+            update_metadata(download_id, info)
         
         # Download the video with retry logic for Windows file locking
         max_retries = 3
@@ -163,13 +545,14 @@ def download_video(url, download_id, quality_height=0):
             try:
                 with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                     info = ydl.extract_info(url, download=True)
+                    update_metadata(download_id, info)
                     filename = ydl.prepare_filename(info)
-                    # For audio, the extension changes to mp3
                     if quality_height == 0:
-                        filename = filename.rsplit('.', 1)[0] + '.mp3'
-                    downloads[download_id]['filename'] = filename
-                    downloads[download_id]['status'] = 'completed'
-                    downloads[download_id]['progress'] = 100
+                        # Re-encode on the post-processing pool so this download slot frees up now
+                        downloads.update(download_id, filename=filename, status='processing', progress=100)
+                        POSTPROCESS_POOL.submit(convert_to_mp3, download_id, filename)
+                    else:
+                        downloads.update(download_id, filename=filename, status='completed', progress=100)
                     return  # Success, exit the function
             except Exception as e:
                 last_error = e
@@ -179,7 +562,7 @@ def download_video(url, download_id, quality_height=0):
                     if attempt < max_retries - 1:
                         # Wait before retry (exponential backoff)
                         time.sleep(2 ** attempt)
-                        downloads[download_id]['status'] = 'retrying'
+                        downloads.update(download_id, status='retrying')
                         continue
                 # If not a file lock error or max retries reached, raise
                 raise
@@ -188,8 +571,7 @@ def download_video(url, download_id, quality_height=0):
         raise last_error
             
     except Exception as e:
-        downloads[download_id]['status'] = 'error'
-        downloads[download_id]['error'] = str(e)
+        downloads.update(download_id, status='error', error=str(e))
 
 
 @app.route('/')
@@ -208,95 +590,51 @@ def get_video_info():
         return jsonify({'error': 'No URL provided'}), 400
     
     try:
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            # FORCE IPv4: Render uses IPv6 by default which YouTube blocks extensively
-            'source_address': '0.0.0.0',
-        }
-
-        # Check for cookies file (Render Secret File or local)
-        # Render mounts secret files at /etc/secrets/ (Read-only)
-        # yt-dlp tries to write to the cookie file, so we must copy it to a writable location
-        import shutil
-        import tempfile
+        info = get_info(url)
         
-        cookie_locations = [
-            '/etc/secrets/cookies.txt',  # Render production path
-            'cookies.txt'                # Local development path
-        ]
+        # Get available quality options
+        quality_options = []
         
-        for cookie_path in cookie_locations:
-            if os.path.exists(cookie_path):
-                # If we are on Render (read-only mount), copy to /tmp
-                if cookie_path.startswith('/etc/secrets'):
-                    try:
-                        temp_dir = tempfile.gettempdir()
-                        writable_cookie_path = os.path.join(temp_dir, 'cookies.txt')
-                        shutil.copy2(cookie_path, writable_cookie_path)
-                        ydl_opts['cookiefile'] = writable_cookie_path
-                        print(f"Copied cookies to writable path: {writable_cookie_path}")
-                    except Exception as e:
-                        print(f"Failed to copy cookies: {e}")
-                        # Fallback to original path (might fail if write is strictly required)
-                        ydl_opts['cookiefile'] = cookie_path
-                else:
-                    ydl_opts['cookiefile'] = cookie_path
-                break
+        # Single pass: keep the highest-bitrate video format for each height
+        best_formats = {}
+        for f in info.get('formats') or []:
+            height = f.get('height')
+            if not height or f.get('vcodec') == 'none':
+                continue
+            best = best_formats.get(height)
+            if best is None or (f.get('tbr') or 0) > (best.get('tbr') or 0):
+                best_formats[height] = f
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-            # Get available quality options
-            quality_options = []
-            seen_heights = set()
+        # Highest resolution first
+        for height, f in sorted(best_formats.items(), reverse=True):
+            # Estimate file size if available
+            filesize = f.get('filesize') or f.get('filesize_approx') or 0
             
-            if info.get('formats'):
-                # Sort formats by height (resolution) in descending order
-                video_formats = [f for f in info['formats'] if f.get('vcodec') != 'none' and f.get('height')]
-                video_formats.sort(key=lambda x: x.get('height', 0), reverse=True)
-                
-                for f in video_formats:
-                    height = f.get('height', 0)
-                    if height and height not in seen_heights:
-                        seen_heights.add(height)
-                        
-                        # Create quality label
-                        if height >= 2160:
-                            label = f"4K ({height}p)"
-                        elif height >= 1440:
-                            label = f"2K ({height}p)"
-                        else:
-                            label = f"{height}p"
-                        
-                        # Estimate file size if available
-                        filesize = f.get('filesize') or f.get('filesize_approx') or 0
-                        
-                        quality_options.append({
-                            'height': height,
-                            'label': label,
-                            'filesize': filesize,
-                            'format_note': f.get('format_note', '')
-                        })
-            
-            # Add audio-only option
             quality_options.append({
-                'height': 0,
-                'label': 'Audio Only (MP3)',
-                'filesize': 0,
-                'format_note': 'audio'
-            })
-            
-            return jsonify({
-                'title': info.get('title', 'Unknown'),
-                'thumbnail': info.get('thumbnail', ''),
-                'duration': info.get('duration', 0),
-                'channel': info.get('channel', info.get('uploader', 'Unknown')),
-                'views': info.get('view_count', 0),
-                'description': info.get('description', '')[:500],
-                'qualities': quality_options
+                'height': height,
+                'label': quality_label(height),
+                'filesize': filesize,
+                'format_note': f.get('format_note', '')
             })
-            
+        
+        # Add audio-only option
+        quality_options.append({
+            'height': 0,
+            'label': 'Audio Only (MP3)',
+            'filesize': 0,
+            'format_note': 'audio'
+        })
+        
+        return jsonify({
+            'title': info.get('title', 'Unknown'),
+            'thumbnail': info.get('thumbnail', ''),
+            'duration': info.get('duration', 0),
+            'channel': info.get('channel', info.get('uploader', 'Unknown')),
+            'views': info.get('view_count', 0),
+            'description': info.get('description', '')[:500],
+            'qualities': quality_options
+        })
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -322,11 +660,22 @@ def start_download():
         return jsonify({'error': 'No URL provided'}), 400
     
     download_id = str(uuid.uuid4())
+    # Register before submitting so progress requests never race the worker
+    downloads.create(
+        download_id,
+        status='queued',
+        progress=0,
+        title='',
+        filename='',
+        error=None,
+        speed=0,
+        eta=0,
+    )
+    # Keep the registry bounded now rather than waiting for the hourly sweep
+    cleanup_downloads()
     
-    # Start download in background thread
-    thread = threading.Thread(target=download_video, args=(url, download_id, quality_height))
-    thread.daemon = True
-    thread.start()
+    # Run download on the bounded pool; it stays 'queued' until a worker is free
+    DOWNLOAD_POOL.submit(download_video, url, download_id, quality_height)
     
     return jsonify({'download_id': download_id})
 
@@ -334,20 +683,77 @@ def start_download():
 @app.route('/api/progress/<download_id>')
 def get_progress(download_id):
     """Get download progress"""
-    if download_id not in downloads:
+    download = downloads.snapshot(download_id)
+    if download is None:
+        return jsonify({'error': 'Download not found'}), 404
+    
+    return jsonify(download)
+
+
+@app.route('/api/progress/stream/<download_id>')
+def stream_progress(download_id):
+    """Stream download progress as Server-Sent Events"""
+    if not _progress_stream_slots.acquire(blocking=False):
+        return jsonify({'error': 'Too many progress streams, poll /api/progress instead'}), 503
+    
+    q, state = downloads.subscribe(download_id)
+    if q is None:
+        _progress_stream_slots.release()
         return jsonify({'error': 'Download not found'}), 404
     
-    return jsonify(downloads[download_id])
+    def generate():
+        pending = state
+        sent_status = None
+        last_sent = 0.0
+        while True:
+            # Coalesce: only the newest queued snapshot matters
+            try:
+                while True:
+                    pending = q.get_nowait()
+            except queue.Empty:
+                pass
+            
+            timeout = SSE_HEARTBEAT
+            if pending is not None:
+                wait = SSE_MIN_INTERVAL - (time.monotonic() - last_sent)
+                if pending['status'] != sent_status or wait <= 0:
+                    yield f"data: {app.json.dumps(pending)}\n\n"
+                    if pending['status'] in FINISHED_STATUSES:
+                        return
+                    sent_status = pending['status']
+                    last_sent = time.monotonic()
+                    pending = None
+                else:
+                    # Hold the update until the interval is up, unless something newer arrives
+                    timeout = wait
+            
+            try:
+                pending = q.get(timeout=timeout)
+            except queue.Empty:
+                if pending is None:
+                    yield ": heartbeat\n\n"
+    
+    def close():
+        downloads.unsubscribe(download_id, q)
+        _progress_stream_slots.release()
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    # Runs when the server closes the response, even if the client left before the
+    # generator started, so the slot is always returned
+    response.call_on_close(close)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Disable response buffering in nginx-style reverse proxies
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @app.route('/api/file/<download_id>')
 def get_file(download_id):
     """Download the completed file"""
-    if download_id not in downloads:
+    download = downloads.snapshot(download_id)
+    if download is None:
         return jsonify({'error': 'Download not found'}), 404
     
-    download = downloads[download_id]
-    
     if download['status'] != 'completed':
         return jsonify({'error': 'Download not completed'}), 400
     
@@ -369,18 +775,14 @@ def get_file(download_id):
         if '.' not in filename:
              filename = filename + '.mp4'
     
-    # Create ASCII-safe version for basic filename parameter
-    ascii_filename = ''.join(c if ord(c) < 128 else '_' for c in filename)
-    
-    # Use urllib to properly encode the filename for UTF-8 version
-    from urllib.parse import quote
-    encoded_filename = quote(filename)
-    
-    response = make_response(send_file(download['filename'], mimetype=mimetype))
-    # Include both ASCII filename and UTF-8 encoded filename* for maximum compatibility
-    response.headers['Content-Disposition'] = f'attachment; filename="{ascii_filename}"; filename*=UTF-8\'\'{encoded_filename}'
-    response.headers['Content-Type'] = mimetype
-    return response
+    # Flask builds the Content-Disposition header, with both an ASCII filename and a
+    # UTF-8 filename* when the name isn't plain ASCII
+    return send_file(
+        download['filename'],
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=filename,
+    )
 
 
 @app.route('/api/downloads')
@@ -388,24 +790,27 @@ def list_downloads():
     """List all downloads in the downloads folder"""
     files = []
     # Support multiple extensions since we use 'best' format now
-    extensions = ['*.mp4', '*.webm', '*.mkv', '*.mp3', '*.m4a']
-    found_files = set()
+    extensions = ('.mp4', '.webm', '.mkv', '.mp3', '.m4a')
     
-    for ext in extensions:
-        for f in DOWNLOAD_DIR.glob(ext):
-            if f.name not in found_files:
+    # One directory scan with a single stat per matching file
+    with os.scandir(DOWNLOAD_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith(extensions) and entry.is_file():
+                stat = entry.stat()
                 files.append({
-                    'name': f.name,
-                    'size': f.stat().st_size,
-                    'modified': f.stat().st_mtime
+                    'name': entry.name,
+                    'size': stat.st_size,
+                    'modified': stat.st_mtime
                 })
-                found_files.add(f.name)
     
     # Sort by modification time (newest first)
     files.sort(key=lambda x: x['modified'], reverse=True)
     return jsonify(files)
 
 
+schedule_cleanup()
+
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print(" YouTube Video Downloader")